@@ -1,21 +1,118 @@
 import sys
+import shutil
 import numpy as np
 import random
 
-from PyQt6.QtCore import QSize, Qt, QTimer
+from PyQt6.QtCore import QSize, Qt, QTimer, QThread, pyqtSignal
 from PyQt6.QtWidgets import * 
 from PyQt6.QtGui import QFontMetrics
 
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 from matplotlib.backends.backend_qtagg import (
         FigureCanvas, NavigationToolbar2QT as NavigationToolbar)
 
 import SolarSysClass as solar
+import SimulationService as service
+from urllib.error import HTTPError, URLError
+
+def submit_job(tab, scenario, prefix):
+    '''
+    Send a scenario from tab to the job service and follow it in the tab's
+    job list. The video is saved as <prefix>_<job id>.mp4
+    '''
+    try:
+        job_id = tab.client.submit(scenario)
+    except HTTPError:
+        tab.status('error')
+        return
+    except (URLError, OSError):
+        tab.status('offline')
+        return
+    tab.jobs = [job for job in tab.jobs if not(job.isFinished())]
+    watcher = JobWatcher(tab.client, job_id, f"{prefix}_{job_id}.mp4", tab.job_list)
+    tab.jobs.append(watcher)
+    watcher.start()
+    tab.status('normal')
+
+class JobWatcher(QThread):
+    '''
+    Follows a submitted job from a background thread, shows its progress
+    in a row of the job list and copies the finished video to filename
+    '''
+    changed = pyqtSignal(str)
+
+    def __init__(self,
+                 client,
+                 job_id,
+                 filename,
+                 job_list):
+        super().__init__()
+        self.client = client
+        self.job_id = job_id
+        self.filename = filename
+        self.running = True
+        self.item = QListWidgetItem(f"{self.filename}: queued")
+        job_list.addItem(self.item)
+        # Delivered on the GUI thread, where this object lives
+        self.changed.connect(self.show_status)
+
+    def show_status(self, text):
+        self.item.setText(f"{self.filename}: {text}")
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        # Anything unexpected is shown in the row rather than ending the
+        # thread silently with the row stuck on its last percentage
+        try:
+            self.follow()
+        except Exception as e:
+            self.changed.emit(f"error: {e!r}")
+
+    def follow(self):
+        while self.running:
+            try:
+                job = self.client.job(self.job_id)
+            except HTTPError as e:
+                if e.code == 404:
+                    self.changed.emit("job no longer on the service")
+                else:
+                    self.changed.emit(f"job service error {e.code}")
+                return
+            except (URLError, OSError):
+                self.changed.emit("job service unavailable")
+                return
+
+            if job["status"] == "done":
+                try:
+                    # The service runs on this machine, so copy the file directly
+                    shutil.copyfile(job["files"]["video"], self.filename)
+                    self.changed.emit("saved")
+                except OSError as e:
+                    self.changed.emit(f"could not save: {e}")
+                self.release()
+                return
+            elif job["status"] in service.FINISHED:
+                self.changed.emit(f"{job['status']}: {job['error']}")
+                self.release()
+                return
+            self.changed.emit(f"{job['stage'] or job['status']} {job['progress']:.0%}")
+            self.msleep(500)
+
+    def release(self):
+        '''Let the service delete the job's files now they are not needed'''
+        try:
+            self.client.delete(self.job_id)
+        except (URLError, OSError):
+            # The service prunes the job itself after its retention
+            pass
+'''End class'''
 
 class MatplotWindow(QMainWindow):
     '''
     Generates a window with a matplotlib plot of the solar system input
+    and a timeline to pause, step back and seek through earlier frames
     '''
     def __init__(self,
                  solar_system,
@@ -26,11 +123,30 @@ class MatplotWindow(QMainWindow):
         self.setCentralWidget(self._main)
         self.interact = interact
         self.solar_system = solar_system
+        self.history = solar.FrameHistory(self.solar_system,
+                                          interact = (self.interact == 'Y'))
         self.canvas = FigureCanvas(self.solar_system.fig)
+
+        self.pause_button = QPushButton("Pause", clicked = self.clicked_pause)
+        self.back_button = QPushButton("Step back", clicked = self.clicked_back)
+        self.forward_button = QPushButton("Step forward", clicked = self.clicked_forward)
+        self.frame_label = QLabel("Frame 0")
+        self.slider = QSlider(Qt.Orientation.Horizontal)
+        self.slider.setRange(0, 0)
+        self.slider.sliderPressed.connect(self.pause)
+        self.slider.valueChanged.connect(self.seek)
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.pause_button)
+        controls.addWidget(self.back_button)
+        controls.addWidget(self.forward_button)
+        controls.addWidget(self.slider)
+        controls.addWidget(self.frame_label)
         
         layout = QVBoxLayout(self._main)
         layout.addWidget(NavigationToolbar(self.canvas, self))
         layout.addWidget(self.canvas)
+        layout.addLayout(controls)
         
         self.update()
         self.show()
@@ -41,11 +157,42 @@ class MatplotWindow(QMainWindow):
         self.timer.start()
 
     def update(self):
-        if self.interact == 'Y':
-            self.solar_system.step()
-        elif self.interact == 'N':
-            self.solar_system.step_no_planet_interact()
+        self.history.forward()
+        self.solar_system.plot_planets()
+        self.refresh()
+
+    def seek(self, frame):
+        self.history.seek(frame)
+        self.solar_system.plot_planets()
+        self.refresh()
+
+    def refresh(self):
+        '''Sync the timeline with the history and redraw the canvas'''
+        self.slider.blockSignals(True)
+        self.slider.setRange(self.history.earliest, self.history.latest)
+        self.slider.setValue(self.history.frame)
+        self.slider.blockSignals(False)
+        self.frame_label.setText(f"Frame {self.history.frame}")
         self.canvas.draw()
+
+    def pause(self):
+        self.timer.stop()
+        self.pause_button.setText("Play")
+
+    def clicked_pause(self):
+        if self.timer.isActive():
+            self.pause()
+        else:
+            self.timer.start()
+            self.pause_button.setText("Pause")
+
+    def clicked_back(self):
+        self.pause()
+        self.seek(self.history.frame - 1)
+
+    def clicked_forward(self):
+        self.pause()
+        self.update()
     
 '''End class'''
 
@@ -58,8 +205,10 @@ class SimulationTab(QWidget):
     (c) Enter mass, position, velocity of planets
     (d) Enter the method: Euler, Leapfrog or Runge-Kutta
     '''
-    def __init__(self):
+    def __init__(self, client):
         super().__init__()
+        self.client = client
+        self.jobs = []
         # Attributes for storing user inputs
         self.num_planets = 0
         self.mass_planets_asWidget = []
@@ -106,6 +255,8 @@ class SimulationTab(QWidget):
         self.select_method = QComboBox()
         self.select_method.addItems(["Euler", "Leapfrog"])
         self.status_label = QLabel("READY")
+        # One row per saved video, updated by its JobWatcher
+        self.job_list = QListWidget()
         
         self.set_dT = QLineEdit()
         self.set_dT.setPlaceholderText("Time increment (integer)")
@@ -122,6 +273,7 @@ class SimulationTab(QWidget):
         g_layout.addWidget(self.generate_button, 4, 1)
         g_layout.addWidget(self.save_button, 4, 2)
         g_layout.addWidget(self.status_label, 5, 0)
+        g_layout.addWidget(self.job_list, 6, 0, 1, 3)
         g_layout.setColumnStretch(5, 3)
 
     # When "Apply" is clicked the variable values are set
@@ -189,31 +341,17 @@ class SimulationTab(QWidget):
         except ValueError:
             self.status('error')
 
-        self.solar_system = solar.SolarSys(self.default_method, delta_t = self.delta_t)
-        planet_dict = {}
+        bodies = []
         for i in range(self.num_planets):
-            key = 'planet'+str(i)
-            if i == 0:
-                planet_dict['key'] = solar.Sun(self.solar_system,
-                                               mass = self.masses[i],
-                                               position = self.positions[i],
-                                               velocity = self.velocities[i])
-            else:
-                planet_dict['key'] = solar.Planet(self.solar_system,
-                                                  mass = self.masses[i],
-                                                  position = self.positions[i],
-                                                  velocity = self.velocities[i])
-
-
-        def animate(i):
-            self.solar_system.step()
-            self.solar_system.fix_axes()
-
-        anim = animation.FuncAnimation(self.solar_system.fig, animate, frames=1200,
-                                       interval=10)
-        writervideo = animation.FFMpegWriter(fps=60)
-        anim.save("simul.mp4", writer=writervideo, dpi = 600)
-        self.status('normal')
+            bodies.append({"mass": float(self.masses[i]),
+                           "position": self.positions[i].tolist(),
+                           "velocity": self.velocities[i].tolist()})
+        scenario = {"method": self.default_method,
+                    "delta_t": self.delta_t,
+                    "interact": True,
+                    "video": True,
+                    "bodies": bodies}
+        submit_job(self, scenario, "simul")
 
     # From user input in self.spinBox set mass, position and velocity of planets
     def set_planet_info(self, input_value):
@@ -323,6 +461,8 @@ class SimulationTab(QWidget):
             self.status_label.setText("Incomplete or incorrect data!")
         elif status == 'busy':
             self.status_label.setText("Busy")
+        elif status == 'offline':
+            self.status_label.setText("Job service unavailable")
 
 '''End class'''
 
@@ -330,13 +470,16 @@ class VelocityTab(QWidget):
     '''
     Generates a collection of planets with randomised velocities
     '''
-    def __init__(self):
+    def __init__(self, client):
         super().__init__()
+        self.client = client
+        self.jobs = []
         self.num_planets = 0
         self.centre_mass = 0
         self.planet_mass = 0
         self.planet_dist = 0
         self.planet_speed = 0
+        self.directions = []
 
 
         self.num_title = QLabel("Number of trajectories to calculate:")
@@ -365,6 +508,8 @@ class VelocityTab(QWidget):
         self.select_method = QComboBox()
         self.select_method.addItems(["Euler", "Leapfrog"])
         self.status_label = QLabel("READY")
+        # One row per saved video, updated by its JobWatcher
+        self.job_list = QListWidget()
         
         self.set_dT = QLineEdit()
         self.set_dT.setPlaceholderText("Time increment (integer)")
@@ -386,6 +531,7 @@ class VelocityTab(QWidget):
         layout.addWidget(self.generate_button, 3, 3)
         layout.addWidget(self.save_button, 4, 3)
         layout.addWidget(self.status_label, 4, 0)
+        layout.addWidget(self.job_list, 5, 0, 1, 4)
         layout.setColumnStretch(4,3)
         layout.setRowStretch(5,1)
 
@@ -410,18 +556,12 @@ class VelocityTab(QWidget):
                         position = np.zeros(3),
                         velocity = np.zeros(3))
 
-        for i in range(self.num_planets):
+        for i, direction in enumerate(self.random_directions()):
             key = 'random'+str(i)
-            theta = np.pi*random.random()
-            phi = 2*np.pi*random.random()
-            vel = self.planet_speed*np.array([np.sin(theta)*np.cos(phi),
-                                              np.sin(theta)*np.sin(phi),
-                                              np.cos(theta)])
-
             random_dict['key'] = solar.Planet(self.solar_system,
                                               mass = self.planet_mass,
                                               position = np.array([self.planet_dist, 0, 0]),
-                                              velocity = vel)
+                                              velocity = self.planet_speed*direction)
 
         self.matplotwindow = MatplotWindow(solar_system = self.solar_system, interact='N')     
         self.matplotwindow.show()
@@ -440,36 +580,21 @@ class VelocityTab(QWidget):
         except ValueError:
             self.status('error')
 
-        self.solar_system = solar.SolarSys(method = self.default_method,
-                                           delta_t = self.delta_t)
-
-        random_dict = {}
-        sun = solar.Sun(self.solar_system,
-                        mass = self.centre_mass,
-                        position = np.zeros(3),
-                        velocity = np.zeros(3))
-
-        for i in range(self.num_planets):
-            key = 'random'+str(i)
-            theta = np.pi*random.random()
-            phi = 2*np.pi*random.random()
-            vel = self.planet_speed*np.array([np.sin(theta)*np.cos(phi),
-                                              np.sin(theta)*np.sin(phi),
-                                              np.cos(theta)])
+        bodies = [{"mass": self.centre_mass,
+                   "position": [0, 0, 0],
+                   "velocity": [0, 0, 0]}]
 
-            random_dict['key'] = solar.Planet(self.solar_system,
-                                              mass = self.planet_mass,
-                                              position = np.array([self.planet_dist, 0, 0]),
-                                              velocity = vel)
+        for direction in self.random_directions():
+            bodies.append({"mass": self.planet_mass,
+                           "position": [self.planet_dist, 0, 0],
+                           "velocity": (self.planet_speed*direction).tolist()})
 
-        def animate(i):
-            self.solar_system.step_no_planet_interact()
-            self.solar_system.fix_axes()
-
-        anim = FuncAnimation(self.solar_system.fig, animate, frames=1200,
-                             interval=10)
-        writervideo = animation.FFMpegWriter(fps=60)
-        anim.save("random.mp4", writer=writervideo, dpi = 600)
+        scenario = {"method": self.default_method,
+                    "delta_t": self.delta_t,
+                    "interact": False,
+                    "video": True,
+                    "bodies": bodies}
+        submit_job(self, scenario, "random")
 
 
     def clicked_apply(self):
@@ -480,6 +605,10 @@ class VelocityTab(QWidget):
             self.planet_mass = float(self.set_planet_mass.text())
             self.planet_dist = float(self.set_planet_dist.text())
             self.planet_speed = float(self.set_planet_speed.text())
+            # New directions are only drawn on Apply, so repeated runs of
+            # the same inputs are the same scenario and hit the result cache
+            self.directions = []
+            self.random_directions()
             
             self.status('normal')
         
@@ -489,6 +618,16 @@ class VelocityTab(QWidget):
     def set_planet_info(self, input_value):
         self.num_planets = input_value
 
+    # Unit vectors for the planet velocities, drawn once per planet
+    def random_directions(self):
+        for i in range(len(self.directions), self.num_planets):
+            theta = np.pi*random.random()
+            phi = 2*np.pi*random.random()
+            self.directions.append(np.array([np.sin(theta)*np.cos(phi),
+                                             np.sin(theta)*np.sin(phi),
+                                             np.cos(theta)]))
+        return self.directions[:self.num_planets]
+
     def status(self, status):
         if status == 'normal':
             self.status_label.setText('READY')
@@ -496,6 +635,8 @@ class VelocityTab(QWidget):
             self.status_label.setText("Incomplete or incorrect data!")
         elif status == 'busy':
             self.status_label.setText("Busy")
+        elif status == 'offline':
+            self.status_label.setText("Job service unavailable")
 '''End class'''
 
 class MainWindow(QMainWindow):
@@ -510,13 +651,32 @@ class MainWindow(QMainWindow):
         # Create tabs for different functions
         tabs = QTabWidget()
         tabs.setDocumentMode(False)
-        simulation = SimulationTab()
-        velocities = VelocityTab()
+        # Simulations are run by the local job service
+        self.client = service.connect()
+        simulation = SimulationTab(self.client)
+        velocities = VelocityTab(self.client)
+        self.tabs = [simulation, velocities]
         tabs.addTab(simulation, "Simulation")
         tabs.addTab(velocities, "Random velocities")
+        if not(self.client.available()):
+            for tab in self.tabs:
+                tab.save_button.setEnabled(False)
+                tab.status('offline')
         
         self.setCentralWidget(tabs)
 
+    def closeEvent(self, event):
+        # Stop the service this window started, so queued jobs don't keep
+        # the interpreter alive after the window is gone
+        for tab in self.tabs:
+            for job in tab.jobs:
+                job.stop()
+            for job in tab.jobs:
+                job.wait()
+        if self.client.service is not None:
+            self.client.service.shutdown()
+        super().closeEvent(event)
+
 '''End class'''
 
 
@@ -0,0 +1,137 @@
+import os
+import shutil
+import hashlib
+import numpy as np
+
+class ResultCache():
+    """
+    Disk-backed cache of trajectories and rendered videos.
+    Entries are named by a hash of the full scenario and the least recently
+    used files are evicted once the directory grows past max_bytes.
+    """
+    def __init__(
+            self,
+            directory = ".simul_cache",
+            max_bytes = 1024**3,
+        ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def scenario_key(self, SolarSys, interact = True):
+        """Hash of the method, time step, interaction and initial planets"""
+        digest = hashlib.sha256()
+        digest.update(f"{SolarSys.method}|{SolarSys.delta_t}|{bool(interact)}".encode())
+        for planet in SolarSys.planets:
+            digest.update(f"|{type(planet).__name__}|{float(planet.mass)!r}".encode())
+        digest.update(SolarSys.get_state().tobytes())
+        return digest.hexdigest()
+
+    def video_key(self, key, frames, fps, dpi):
+        """Hash of a scenario key and the video settings"""
+        return hashlib.sha256(f"{key}|{frames}|{fps}|{dpi}".encode()).hexdigest()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def touch(self, path):
+        """Mark a file as recently used"""
+        os.utime(path)
+
+    def temp_path(self, path):
+        """Per-process scratch name so parallel writers never collide"""
+        return f"{path}.{os.getpid()}.tmp"
+
+    def load_trajectory(self, key):
+        """Cached states for the scenario, or None if nothing is stored"""
+        path = self.path(key + ".npy")
+        try:
+            trajectory = np.load(path)
+            self.touch(path)
+        except (OSError, ValueError):
+            # Missing, or evicted by another process while loading
+            return None
+        return trajectory
+
+    def store_trajectory(self, key, trajectory):
+        """Store the states unless a longer run is already cached"""
+        path = self.path(key + ".npy")
+        try:
+            if len(np.load(path, mmap_mode="r")) >= len(trajectory):
+                return
+        except (OSError, ValueError):
+            pass
+        temp = self.temp_path(path)
+        with open(temp, "wb") as f:
+            np.save(f, trajectory)
+        os.replace(temp, path)
+        self.evict()
+
+    def trajectory(self, SolarSys, interact = True, frames = 1200, callback = None):
+        """
+        States of the first frames+1 steps, starting from the initial state.
+        A shorter cached run is extended by integrating on from its last state.
+        The solar system is left at the last state returned.
+        callback(step, frames) is called after every integrated step.
+        """
+        key = self.scenario_key(SolarSys, interact)
+        cached = self.load_trajectory(key)
+        if cached is None:
+            cached = SolarSys.get_state()[np.newaxis]
+        if len(cached) > frames:
+            SolarSys.set_state(cached[frames])
+            return cached[:frames+1]
+
+        SolarSys.set_state(cached[-1])
+        states = [cached]
+        for i in range(len(cached), frames+1):
+            SolarSys.integrate(interact)
+            states.append(SolarSys.get_state()[np.newaxis])
+            if callback is not None:
+                callback(i, frames)
+        trajectory = np.concatenate(states)
+        self.store_trajectory(key, trajectory)
+        return trajectory
+
+    def copy_video(self, key, filename):
+        """Copy the cached video to filename, returning False if there is none"""
+        path = self.path(key + ".mp4")
+        try:
+            shutil.copyfile(path, filename)
+            self.touch(path)
+        except OSError:
+            # Missing, or evicted by another process while copying
+            return False
+        return True
+
+    def store_video(self, key, filename):
+        """Copy a rendered video into the cache"""
+        path = self.path(key + ".mp4")
+        temp = self.temp_path(path)
+        shutil.copyfile(filename, temp)
+        os.replace(temp, path)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used files until under max_bytes"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self.path(name)
+            if name.endswith(".tmp") or not(os.path.isfile(path)):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+'''End class'''
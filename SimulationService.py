@@ -0,0 +1,567 @@
+import os
+import sys
+import json
+import queue
+import time
+import uuid
+import shutil
+import argparse
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request
+from urllib.error import URLError
+
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+
+import SolarSysClass as solar
+from SimulationCache import ResultCache
+
+HOST = "127.0.0.1"
+PORT = 8765
+METHODS = ["Euler", "Leapfrog"]
+MAX_FRAMES = 20000
+FINISHED = ["done", "failed", "cancelled"]
+
+def build_solar_system(scenario):
+    '''
+    Create a solar system from a scenario dictionary.
+    The first body is the fixed central body, the rest are planets.
+    '''
+    solar_system = solar.SolarSys(method = scenario["method"],
+                                  delta_t = scenario["delta_t"])
+    for i, body in enumerate(scenario["bodies"]):
+        if i == 0:
+            body_class = solar.Sun
+        else:
+            body_class = solar.Planet
+        body_class(solar_system,
+                   mass = float(body["mass"]),
+                   position = np.array(body["position"], dtype=float),
+                   velocity = np.array(body["velocity"], dtype=float))
+    return solar_system
+
+
+def is_integer(value):
+    # JSON true/false arrive as bool, which is a subclass of int
+    return isinstance(value, int) and not(isinstance(value, bool))
+
+
+def is_number(value):
+    return (isinstance(value, (int, float)) and not(isinstance(value, bool))
+            and bool(np.isfinite(value)))
+
+
+def check_scenario(scenario):
+    '''Raise ValueError if a submitted scenario cannot be run'''
+    if not(isinstance(scenario, dict)):
+        raise ValueError("Scenario must be a JSON object")
+    if scenario.get("method") not in METHODS:
+        raise ValueError(f"Method must be one of {METHODS}")
+    delta_t = scenario.get("delta_t")
+    if not(is_integer(delta_t)) or delta_t <= 0:
+        raise ValueError("delta_t must be a positive integer")
+    frames = scenario.get("frames", 1200)
+    if not(is_integer(frames)) or not(0 < frames <= MAX_FRAMES):
+        raise ValueError(f"frames must be an integer from 1 to {MAX_FRAMES}")
+    for flag in ["interact", "video"]:
+        if not(isinstance(scenario.get(flag, False), bool)):
+            raise ValueError(f"{flag} must be true or false")
+    bodies = scenario.get("bodies")
+    if not(isinstance(bodies, list)) or len(bodies) == 0:
+        raise ValueError("At least one body is required")
+    for body in bodies:
+        if not(isinstance(body, dict)) or not(is_number(body.get("mass"))):
+            raise ValueError("Every body needs a numeric mass")
+        for vector in [body.get("position"), body.get("velocity")]:
+            if (not(isinstance(vector, list)) or len(vector) != 3
+                    or not(all(is_number(x) for x in vector))):
+                raise ValueError("Positions and velocities need 3 numeric components")
+
+
+def save_video(solar_system, interact, filename, cache,
+               frames = 1200, fps = 60, dpi = 600, callback = None):
+    '''
+    Render the first frames steps of solar_system to filename, reusing the
+    cached video or trajectory of an identical scenario when there is one
+    '''
+    key = cache.scenario_key(solar_system, interact)
+    video_key = cache.video_key(key, frames, fps, dpi)
+    if cache.copy_video(video_key, filename):
+        return
+
+    trajectory = cache.trajectory(solar_system, interact, frames)
+
+    def animate(i):
+        solar_system.set_state(trajectory[i+1])
+        solar_system.plot_planets()
+        solar_system.fix_axes()
+
+    anim = animation.FuncAnimation(solar_system.fig, animate, frames=frames,
+                                   interval=10)
+    writervideo = animation.FFMpegWriter(fps=fps)
+    anim.save(filename, writer=writervideo, dpi = dpi, progress_callback=callback)
+    cache.store_video(video_key, filename)
+
+
+def worker_loop(tasks, events):
+    '''
+    Body of a worker process: run jobs from tasks until the service
+    terminates it, reporting progress and results on events
+    '''
+    # Workers render off-screen, whatever backend the parent process uses
+    plt.switch_backend("Agg")
+    while True:
+        task = tasks.get()
+        job_id = task[0]
+        events.put(("running", job_id, os.getpid()))
+        try:
+            events.put(("done", job_id, run_job(*task, events)))
+        except Exception as e:
+            events.put(("failed", job_id, repr(e)))
+
+
+def run_job(job_id, scenario, output_dir, cache_dir, events):
+    '''
+    Run one scenario in a worker process.
+    Returns the names and paths of the files written to output_dir.
+    '''
+    def report(stage):
+        # Only send whole percents, not an event for every step
+        last = -1
+        def callback(done, total):
+            nonlocal last
+            percent = 100*done // max(total, 1)
+            if percent != last:
+                last = percent
+                events.put(("progress", job_id, {"stage": stage,
+                                                 "progress": percent / 100}))
+        return callback
+
+    report("integrating")(0, 1)
+    cache = ResultCache(cache_dir)
+    interact = scenario.get("interact", True)
+    frames = scenario.get("frames", 1200)
+    files = {}
+
+    solar_system = build_solar_system(scenario)
+    trajectory = cache.trajectory(solar_system, interact, frames,
+                                  callback = report("integrating"))
+    plt.close(solar_system.fig)
+    files["trajectory"] = os.path.join(output_dir, job_id + ".npy")
+    np.save(files["trajectory"], trajectory)
+
+    if scenario.get("video", False):
+        solar_system = build_solar_system(scenario)
+        files["video"] = os.path.join(output_dir, job_id + ".mp4")
+        save_video(solar_system, interact, files["video"], cache, frames,
+                   callback = report("rendering"))
+        plt.close(solar_system.fig)
+    return files
+
+
+class JobService():
+    '''
+    Queues submitted scenarios and runs them on a pool of worker processes
+    '''
+    def __init__(self,
+                 host = HOST,
+                 port = PORT,
+                 workers = 2,
+                 output_dir = "simul_output",
+                 cache_dir = ".simul_cache",
+                 retention = 3600):
+        # Absolute, so clients in another directory can copy the outputs
+        self.output_dir = os.path.abspath(output_dir)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.retention = retention
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.closing = False
+
+        # Bind first, so a taken port fails before any process is started
+        self.server = ThreadingHTTPServer((host, port), JobRequestHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+
+        # Spawned workers do not inherit the GUI's Qt state. The service
+        # owns them so that shutdown can stop a job in the middle of a render
+        self.context = multiprocessing.get_context("spawn")
+        self.tasks = self.context.Queue()
+        self.events = self.context.Queue()
+        self.workers = [self.start_worker() for i in range(workers)]
+        # Job id each worker (by pid) is running
+        self.running = {}
+        self.collector = threading.Thread(target = self.collect, daemon = True)
+        self.collector.start()
+
+    def start_worker(self):
+        worker = self.context.Process(target = worker_loop,
+                                      args = (self.tasks, self.events),
+                                      daemon = True)
+        worker.start()
+        return worker
+
+    def submit(self, scenario):
+        '''Queue a scenario and return its job id'''
+        return self.submit_batch([scenario])[0]
+
+    def submit_batch(self, scenarios):
+        '''
+        Queue several scenarios and return their job ids.
+        Nothing is queued unless every scenario is valid.
+        '''
+        for scenario in scenarios:
+            check_scenario(scenario)
+        self.prune()
+        job_ids = []
+        for scenario in scenarios:
+            job_id = uuid.uuid4().hex[:12]
+            with self.lock:
+                if self.closing:
+                    raise RuntimeError("Job service is shutting down")
+                self.jobs[job_id] = {"id": job_id, "status": "queued", "stage": None,
+                                     "progress": 0.0, "files": {}, "error": None}
+            self.tasks.put((job_id, scenario, self.output_dir, self.cache_dir))
+            job_ids.append(job_id)
+        return job_ids
+
+    def collect(self):
+        '''Apply worker events to the jobs until the service closes'''
+        while not(self.closing):
+            try:
+                event, job_id, value = self.events.get(timeout = 0.2)
+            except queue.Empty:
+                self.replace_dead_workers()
+                continue
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if self.closing or job is None:
+                    continue
+                if event == "running":
+                    job["status"] = "running"
+                    self.running[value] = job_id
+                elif event == "progress":
+                    job.update(value)
+                else:
+                    self.finish(job, event, value)
+
+    def finish(self, job, status, value):
+        '''Record the end of a job; called with the lock held'''
+        job["status"] = status
+        if status == "done":
+            job["files"] = value
+            job["progress"] = 1.0
+        else:
+            job["error"] = value
+        job["finished"] = time.time()
+        for pid, job_id in list(self.running.items()):
+            if job_id == job["id"]:
+                del self.running[pid]
+
+    def replace_dead_workers(self):
+        '''Fail the job of any worker that died and start a new worker'''
+        for i, worker in enumerate(self.workers):
+            if worker.is_alive() or self.closing:
+                continue
+            with self.lock:
+                job = self.jobs.get(self.running.pop(worker.pid, None))
+                if job is not None:
+                    self.finish(job, "failed",
+                                f"Worker exited with code {worker.exitcode}")
+            self.workers[i] = self.start_worker()
+
+    def delete(self, job_id):
+        '''
+        Forget a finished job and remove its output files.
+        Returns False if the job is still queued or running.
+        '''
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and "finished" not in job:
+                return False
+            self.jobs.pop(job_id, None)
+        for extension in [".npy", ".mp4"]:
+            try:
+                os.remove(os.path.join(self.output_dir, job_id + extension))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def prune(self):
+        '''Delete jobs that finished more than retention seconds ago'''
+        cutoff = time.time() - self.retention
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.get("finished", cutoff) < cutoff]
+        for job_id in expired:
+            self.delete(job_id)
+
+    def job(self, job_id):
+        '''Status of a job, or None if the id is unknown'''
+        with self.lock:
+            if job_id not in self.jobs:
+                return None
+            job = dict(self.jobs[job_id])
+        job.pop("finished", None)
+        job["files"] = dict(job["files"])
+        return job
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def job_ids(self):
+        self.prune()
+        with self.lock:
+            return list(self.jobs)
+
+    def file_path(self, job_id, name):
+        '''Path of an output file of a finished job, or None'''
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return job["files"].get(name)
+
+    def start(self):
+        '''Serve requests from a background thread'''
+        thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        thread.start()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        '''Stop serving, cancel queued jobs and stop the running ones'''
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            self.closing = True
+            for job in self.jobs.values():
+                if "finished" not in job:
+                    self.finish(job, "cancelled", "Job service shut down")
+        self.collector.join()
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join()
+        # Unread tasks and events are dropped rather than flushed at exit
+        for pipe in [self.tasks, self.events]:
+            pipe.cancel_join_thread()
+            pipe.close()
+'''End class'''
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    '''
+    HTTP API of the job service:
+    POST /jobs                          submit a scenario (or a list of them)
+    GET  /jobs                          list job ids
+    GET  /jobs/<id>                     status and progress of a job
+    GET  /jobs/<id>/progress            stream progress as JSON lines until finished
+    GET  /jobs/<id>/files/<name>        download "trajectory" or "video"
+    DELETE /jobs/<id>                   remove a finished job and its files
+    Finished jobs are also removed once they are older than the retention.
+    '''
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self.send_error(404)
+            return
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+            if isinstance(body, list):
+                reply = {"ids": service.submit_batch(body)}
+            else:
+                reply = {"id": service.submit(body)}
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, str(e))
+            return
+        except RuntimeError as e:
+            self.send_error(503, str(e))
+            return
+        self.send_json(reply, status = 202)
+
+    def do_GET(self):
+        service = self.server.service
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            self.send_json({"ids": service.job_ids()})
+            return
+        job = None
+        if len(parts) >= 2 and parts[0] == "jobs":
+            job = service.job(parts[1])
+        if job is None:
+            self.send_error(404)
+            return
+
+        job_id = parts[1]
+        if len(parts) == 2:
+            self.send_json(job)
+        elif parts[2:] == ["progress"]:
+            self.stream_progress(job_id)
+        elif len(parts) == 4 and parts[2] == "files":
+            self.send_file(service.file_path(job_id, parts[3]))
+        else:
+            self.send_error(404)
+
+    def do_DELETE(self):
+        service = self.server.service
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "jobs" or service.job(parts[1]) is None:
+            self.send_error(404)
+            return
+        if not(service.delete(parts[1])):
+            self.send_error(409, "Job has not finished")
+            return
+        self.send_response(204)
+        self.end_headers()
+
+    def send_json(self, data, status = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, path):
+        if path is None or not(os.path.exists(path)):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        try:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away mid-download
+            return
+
+    def stream_progress(self, job_id, interval = 0.5):
+        # No Content-Length: the stream ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        while True:
+            job = self.server.service.job(job_id)
+            if job is None:
+                # Deleted or pruned since the last line
+                return
+            try:
+                self.wfile.write((json.dumps(job) + "\n").encode())
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped listening
+                return
+            if job["status"] in FINISHED:
+                break
+            time.sleep(interval)
+
+    def log_message(self, format, *args):
+        """Keep the GUI's console free of polling requests"""
+        pass
+'''End class'''
+
+
+class SimulationClient():
+    '''
+    Client of the job service, used by the GUI and by scripts
+    '''
+    def __init__(self,
+                 host = HOST,
+                 port = PORT):
+        self.url = f"http://{host}:{port}"
+        # The service this client started, if any (see connect)
+        self.service = None
+
+    def call(self, method, path, data = None, timeout = 10):
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+        req = request.Request(self.url + path, data = body, method = method,
+                              headers = {"Content-Type": "application/json"})
+        with request.urlopen(req, timeout = timeout) as response:
+            return json.loads(response.read())
+
+    def available(self):
+        '''Whether a service is listening at the url'''
+        try:
+            # Short timeout: a program that is not the service may never answer
+            self.call("GET", "/jobs", timeout = 1)
+            return True
+        except (URLError, OSError, ValueError):
+            return False
+
+    def submit(self, scenario):
+        return self.call("POST", "/jobs", scenario)["id"]
+
+    def submit_batch(self, scenarios):
+        return self.call("POST", "/jobs", scenarios)["ids"]
+
+    def job(self, job_id):
+        return self.call("GET", f"/jobs/{job_id}")
+
+    def delete(self, job_id):
+        '''Release a finished job and its output files on the service'''
+        req = request.Request(f"{self.url}/jobs/{job_id}", method = "DELETE")
+        with request.urlopen(req, timeout = 10):
+            pass
+
+    def download(self, job_id, name, filename):
+        '''Save the output file name ("trajectory" or "video") of a job to filename'''
+        with request.urlopen(f"{self.url}/jobs/{job_id}/files/{name}") as response:
+            with open(filename, "wb") as f:
+                shutil.copyfileobj(response, f)
+'''End class'''
+
+
+def connect(host = HOST, port = PORT, workers = 2,
+            output_dir = "simul_output", cache_dir = ".simul_cache"):
+    '''
+    Return a client of the service at host:port. If nothing answers there,
+    a service is started in this process, on a free port if another program
+    holds port. The caller owns client.service and must shut it down.
+    If no service can be started the client is returned unavailable.
+    '''
+    client = SimulationClient(host, port)
+    if client.available():
+        return client
+    for candidate in [port, 0]:
+        try:
+            client.service = JobService(host, candidate, workers,
+                                        output_dir, cache_dir)
+        except OSError:
+            continue
+        client.service.start()
+        client.url = f"http://{host}:{client.service.port}"
+        break
+    return client
+
+
+# Run the service on its own
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Local simulation job service")
+    parser.add_argument("--host", default = HOST)
+    parser.add_argument("--port", type = int, default = PORT)
+    parser.add_argument("--workers", type = int, default = os.cpu_count())
+    parser.add_argument("--output", default = "simul_output")
+    parser.add_argument("--cache", default = ".simul_cache")
+    parser.add_argument("--retention", type = float, default = 3600,
+                        help = "seconds to keep the outputs of finished jobs")
+    args = parser.parse_args()
+
+    service = JobService(args.host, args.port, args.workers, args.output, args.cache,
+                         args.retention)
+    print(f"Serving simulation jobs on http://{args.host}:{args.port}", file = sys.stderr)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        service.shutdown()
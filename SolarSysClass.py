@@ -2,6 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from mpl_toolkits.mplot3d import Axes3D
+from collections import OrderedDict
 
 class SolarSys():
     """This class contains all of the planets and their motion"""
@@ -21,38 +22,44 @@ class SolarSys():
     
 
     def step(self):
-        if self.method == "Euler":
-            for planet in self.planets:
-                planet.update_position(self.delta_t)
-            self.planet_interaction(self.delta_t)
-
-        elif self.method == "Leapfrog":
-            for planet in self.planets:
-                planet.update_position(self.delta_t / 2)
-
-            self.planet_interaction(self.delta_t)
-
-            for planet in self.planets:
-                planet.update_position(self.delta_t / 2)
-
+        self.integrate(interact = True)
         self.plot_planets()
     
     def step_no_planet_interact(self):
+        self.integrate(interact = False)
+        self.plot_planets()
+
+    def integrate(self, interact = True):
+        """Advance the planets by one time step without plotting"""
+        if interact:
+            interaction = self.planet_interaction
+        else:
+            interaction = self.interaction_sun_only
+
         if self.method == "Euler":
             for planet in self.planets:
                 planet.update_position(self.delta_t)
-            self.interaction_sun_only(self.delta_t)
+            interaction(self.delta_t)
 
         elif self.method == "Leapfrog":
             for planet in self.planets:
                 planet.update_position(self.delta_t / 2)
 
-            self.interaction_sun_only(self.delta_t)
+            interaction(self.delta_t)
 
             for planet in self.planets:
                 planet.update_position(self.delta_t / 2)
 
-        self.plot_planets()
+    def get_state(self):
+        """Positions and velocities of all planets as an (N, 2, N_DIM) array"""
+        return np.array([[planet.position, planet.velocity] for planet in self.planets],
+                        dtype=float)
+
+    def set_state(self, state):
+        """Restore positions and velocities from an array made by get_state"""
+        for planet, (position, velocity) in zip(self.planets, state):
+            planet.position = np.array(position, dtype=float)
+            planet.velocity = np.array(velocity, dtype=float)
 
     def add_planet(self, planet):
         """Add a new planet to the planets array"""
@@ -188,3 +195,62 @@ class Sun(Planet):
         """Position is unchanged"""
         self.position = self.position
 '''End class'''
+
+
+class FrameHistory():
+    """
+    Bounded history of a solar system's states.
+    A keyframe is stored every keyframe_interval steps and any earlier frame
+    is rebuilt by re-integrating from the nearest keyframe before it.
+    """
+    def __init__(
+            self,
+            SolarSys,
+            interact = True,
+            keyframe_interval = 25,
+            max_keyframes = 400,
+        ):
+        self.SolarSys = SolarSys
+        self.interact = interact
+        self.keyframe_interval = keyframe_interval
+        self.max_keyframes = max_keyframes
+        self.keyframes = OrderedDict()
+        self.frame = 0
+        self.latest = 0
+        self.save_keyframe()
+
+    @property
+    def earliest(self):
+        """Oldest frame that can still be reached"""
+        return next(iter(self.keyframes))
+
+    def save_keyframe(self):
+        """Store the current state, dropping the oldest keyframe if full"""
+        if self.frame in self.keyframes:
+            return
+        self.keyframes[self.frame] = self.SolarSys.get_state()
+        while len(self.keyframes) > self.max_keyframes:
+            self.keyframes.popitem(last=False)
+
+    def load_keyframe(self, frame):
+        """Restore the solar system to the keyframe stored at frame"""
+        self.SolarSys.set_state(self.keyframes[frame])
+        self.frame = frame
+
+    def forward(self):
+        """Integrate one step past the current frame"""
+        self.SolarSys.integrate(self.interact)
+        self.frame += 1
+        self.latest = max(self.latest, self.frame)
+        if self.frame % self.keyframe_interval == 0:
+            self.save_keyframe()
+
+    def seek(self, target):
+        """Move to target, re-integrating at most keyframe_interval steps"""
+        target = min(max(target, self.earliest), self.latest)
+        # Keyframes are kept at every multiple of the interval after earliest
+        keyframe = target - target % self.keyframe_interval
+        if not(keyframe <= self.frame <= target):
+            self.load_keyframe(keyframe)
+        while self.frame < target:
+            self.forward()
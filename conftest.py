@@ -0,0 +1,43 @@
+import matplotlib
+
+# Tests build figures without a display
+matplotlib.use("Agg")
+
+import numpy as np
+import matplotlib.pyplot as plt
+import pytest
+
+import SolarSysClass as solar
+
+
+def build_system(method = "Leapfrog", delta_t = 1, speed = 3.0):
+    """A sun and two planets, one of them out of the plane"""
+    solar_system = solar.SolarSys(method = method, delta_t = delta_t)
+    solar.Sun(solar_system, mass = 1000,
+              position = np.zeros(3), velocity = np.zeros(3))
+    solar.Planet(solar_system, mass = 1,
+                 position = np.array([100.0, 0, 0]), velocity = np.array([0, speed, 0]))
+    solar.Planet(solar_system, mass = 2,
+                 position = np.array([0, -150.0, 10]), velocity = np.array([2.5, 0, 0]))
+    return solar_system
+
+
+@pytest.fixture
+def make_system():
+    """Factory for the test solar system; its figures are closed afterwards"""
+    yield build_system
+    plt.close("all")
+
+
+@pytest.fixture
+def straight_run():
+    """States of the test solar system over steps plain integration steps"""
+    def run(steps, interact = True, **system):
+        solar_system = build_system(**system)
+        states = [solar_system.get_state()]
+        for i in range(steps):
+            solar_system.integrate(interact)
+            states.append(solar_system.get_state())
+        plt.close(solar_system.fig)
+        return np.array(states)
+    return run
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import SolarSysClass as solar
+
+
+@pytest.mark.parametrize("interact", [True, False])
+def test_seek_matches_straight_run(interact, make_system, straight_run):
+    solar_system = make_system()
+    history = solar.FrameHistory(solar_system, interact = interact,
+                                 keyframe_interval = 5)
+    for i in range(37):
+        history.forward()
+
+    for target in [12, 0, 37, 5, 36, 20]:
+        history.seek(target)
+        assert history.frame == target
+        assert np.array_equal(solar_system.get_state(), straight_run(target, interact)[-1])
+
+
+def test_seek_after_keyframes_are_evicted(make_system, straight_run):
+    solar_system = make_system()
+    history = solar.FrameHistory(solar_system, keyframe_interval = 4,
+                                 max_keyframes = 3)
+    for i in range(30):
+        history.forward()
+
+    assert list(history.keyframes) == [20, 24, 28]
+    assert history.earliest == 20
+
+    history.seek(22)
+    assert np.array_equal(solar_system.get_state(), straight_run(22)[-1])
+    # Frames older than the earliest keyframe are clamped to it
+    history.seek(3)
+    assert history.frame == 20
+    assert np.array_equal(solar_system.get_state(), straight_run(20)[-1])
+    history.seek(100)
+    assert history.frame == 30
+    assert np.array_equal(solar_system.get_state(), straight_run(30)[-1])
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+
+from SimulationCache import ResultCache
+
+
+def test_scenario_key(tmp_path, make_system):
+    cache = ResultCache(tmp_path)
+    key = cache.scenario_key(make_system())
+    assert key == cache.scenario_key(make_system())
+    assert key != cache.scenario_key(make_system(), interact = False)
+    assert key != cache.scenario_key(make_system(method = "Euler"))
+    assert key != cache.scenario_key(make_system(delta_t = 2))
+    assert key != cache.scenario_key(make_system(speed = 3.5))
+
+
+def test_trajectory_prefix_and_extension(tmp_path, make_system, straight_run):
+    cache = ResultCache(tmp_path)
+    key = cache.scenario_key(make_system())
+
+    trajectory = cache.trajectory(make_system(), frames = 20)
+    assert trajectory.shape == (21, 3, 2, 3)
+    assert len(cache.load_trajectory(key)) == 21
+
+    # A shorter run is served from the cached prefix
+    solar_system = make_system()
+    prefix = cache.trajectory(solar_system, frames = 8)
+    assert np.array_equal(prefix, trajectory[:9])
+    assert np.array_equal(solar_system.get_state(), trajectory[8])
+
+    # A longer run extends the cache and matches a fresh integration exactly
+    extended = cache.trajectory(make_system(), frames = 50)
+    assert np.array_equal(extended, straight_run(50))
+    assert len(cache.load_trajectory(key)) == 51
+
+
+def test_store_keeps_longer_trajectory(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.store_trajectory("key", np.zeros((10, 1, 2, 3)))
+    cache.store_trajectory("key", np.ones((5, 1, 2, 3)))
+    assert np.array_equal(cache.load_trajectory("key"), np.zeros((10, 1, 2, 3)))
+
+
+def test_copy_video(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    assert not(cache.copy_video("missing", tmp_path / "out.mp4"))
+
+    (tmp_path / "render.mp4").write_bytes(b"video")
+    cache.store_video("key", tmp_path / "render.mp4")
+    assert cache.copy_video("key", tmp_path / "out.mp4")
+    assert (tmp_path / "out.mp4").read_bytes() == b"video"
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_bytes = 2500)
+    for i, name in enumerate(["a", "b", "c"]):
+        path = tmp_path / "cache" / (name + ".mp4")
+        path.write_bytes(bytes(1000))
+        os.utime(path, (i, i))
+
+    # Reading "a" makes "b" the least recently used
+    assert cache.copy_video("a", tmp_path / "out.mp4")
+    cache.evict()
+    assert sorted(os.listdir(tmp_path / "cache")) == ["a.mp4", "c.mp4"]
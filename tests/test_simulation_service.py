@@ -0,0 +1,154 @@
+import os
+import copy
+import json
+import time
+from urllib import request
+import numpy as np
+import pytest
+
+import SimulationService as service
+
+
+SCENARIO = {"method": "Leapfrog",
+            "delta_t": 1,
+            "frames": 30,
+            "interact": True,
+            "bodies": [{"mass": 1000, "position": [0, 0, 0], "velocity": [0, 0, 0]},
+                       {"mass": 1, "position": [100, 0, 0], "velocity": [0, 3, 0]}]}
+
+
+def changed(**fields):
+    scenario = copy.deepcopy(SCENARIO)
+    scenario.update(fields)
+    return scenario
+
+
+def test_valid_scenario():
+    service.check_scenario(SCENARIO)
+
+
+@pytest.mark.parametrize("scenario", [
+    changed(method = "RK4"),
+    changed(delta_t = 0),
+    changed(delta_t = True),
+    changed(delta_t = 1.5),
+    changed(frames = True),
+    changed(frames = service.MAX_FRAMES + 1),
+    changed(interact = "yes"),
+    changed(video = 1),
+    changed(bodies = []),
+    changed(bodies = [{"mass": "heavy", "position": [0, 0, 0], "velocity": [0, 0, 0]}]),
+    changed(bodies = [{"mass": 1, "position": ["a", "b", "c"], "velocity": [0, 0, 0]}]),
+    changed(bodies = [{"mass": 1, "position": [0, 0], "velocity": [0, 0, 0]}]),
+    changed(bodies = [{"mass": 1, "position": [0, 0, 0], "velocity": [True, 0, 0]}]),
+    [SCENARIO],
+])
+def test_invalid_scenario(scenario):
+    with pytest.raises(ValueError):
+        service.check_scenario(scenario)
+
+
+@pytest.fixture
+def job_service(tmp_path):
+    job_service = service.JobService(port = 0, workers = 1,
+                                     output_dir = tmp_path / "output",
+                                     cache_dir = tmp_path / "cache")
+    job_service.start()
+    yield job_service
+    job_service.shutdown()
+
+
+def wait_for(client, job_id, timeout = 60):
+    start = time.time()
+    while time.time() - start < timeout:
+        job = client.job(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(job_id)
+
+
+def test_batch_is_rejected_as_a_whole(job_service):
+    with pytest.raises(ValueError):
+        job_service.submit_batch([SCENARIO, changed(delta_t = -1)])
+    assert job_service.job_ids() == []
+
+
+def test_trajectory_job(job_service, tmp_path):
+    client = service.SimulationClient(port = job_service.port)
+    job_id = client.submit(SCENARIO)
+    job = wait_for(client, job_id)
+    assert job["status"] == "done"
+    assert job["progress"] == 1.0
+
+    client.download(job_id, "trajectory", tmp_path / "states.npy")
+    trajectory = np.load(tmp_path / "states.npy")
+    assert trajectory.shape == (31, 2, 2, 3)
+
+
+def test_finished_jobs_are_released(job_service):
+    client = service.SimulationClient(port = job_service.port)
+    job_ids = client.submit_batch([SCENARIO, changed(frames = 10)])
+    paths = [wait_for(client, job_id)["files"]["trajectory"] for job_id in job_ids]
+    assert all(os.path.exists(path) for path in paths)
+
+    client.delete(job_ids[0])
+    assert not(os.path.exists(paths[0]))
+    assert job_service.job(job_ids[0]) is None
+
+    # Anything past the retention is pruned on the next listing
+    job_service.retention = 0
+    assert client.call("GET", "/jobs") == {"ids": []}
+    assert not(os.path.exists(paths[1]))
+
+
+def test_connect_falls_back_to_a_free_port(tmp_path):
+    import socket
+    with socket.socket() as taken:
+        # Something other than the service holds the port
+        taken.bind((service.HOST, 0))
+        taken.listen()
+        port = taken.getsockname()[1]
+        client = service.connect(port = port, workers = 1,
+                                 output_dir = tmp_path / "output",
+                                 cache_dir = tmp_path / "cache")
+        try:
+            assert client.service is not None
+            assert client.service.port != port
+            assert client.available()
+        finally:
+            client.service.shutdown()
+
+
+def test_shutdown_cancels_running_and_queued_jobs(tmp_path):
+    job_service = service.JobService(port = 0, workers = 1,
+                                     output_dir = tmp_path / "output",
+                                     cache_dir = tmp_path / "cache")
+    job_service.start()
+    long_run = changed(frames = service.MAX_FRAMES)
+    running, queued = job_service.submit_batch([long_run, long_run])
+    start = time.time()
+    while job_service.job(running)["status"] != "running":
+        assert time.time() - start < 60
+        time.sleep(0.05)
+
+    start = time.time()
+    job_service.shutdown()
+    assert time.time() - start < 5
+    for job_id in [running, queued]:
+        job = job_service.job(job_id)
+        assert job["status"] == "cancelled"
+    assert not(any(worker.is_alive() for worker in job_service.workers))
+
+
+def test_progress_stream_ends_when_job_is_deleted(job_service, monkeypatch):
+    job_id = job_service.submit(SCENARIO)
+    running = job_service.job(job_id)
+    # Two polls see the job, then it is deleted by another client
+    answers = iter([running, running])
+    monkeypatch.setattr(job_service, "job", lambda job_id: next(answers, None))
+
+    client = service.SimulationClient(port = job_service.port)
+    with request.urlopen(f"{client.url}/jobs/{job_id}/progress", timeout = 10) as stream:
+        lines = stream.read().decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [job_id]